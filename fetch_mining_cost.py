@@ -1,13 +1,30 @@
 import json
 import csv
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
+import tempfile
 
 # 파일 저장 설정
 DATA_FILE = 'data.json'
 BTC_HISTORY_FILE = 'btc_history.json'
 BTC_CSV_FILE = 'BTC_USD.csv'
+CACHE_DIR = '.cache'
+# 캐시 유효 기간 (UTC 일 단위, 0 = 당일만)
+# timespan=all 은 최근 1년 일별 데이터가 덮어쓰므로 며칠 지난 것도 그대로 사용 가능
+CACHE_MAX_AGE_DAYS = {'all': 7}
+
+# blockchain.info 연결 재사용 (동시 요청 4개), 일시적 오류/429/5xx는 지수 백오프(대기 0, 2, 4초)로 재시도
+# Retry-After는 상한이 없어 무시함 -> 재시도 대기 시간이 항상 유한
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                                      max_retries=Retry(total=3, backoff_factor=1.0,
+                                                        status_forcelist=(429, 500, 502, 503, 504),
+                                                        respect_retry_after_header=False)))
 
 # === Cash Cost 모델 파라미터 ===
 ELECTRICITY_LOW = 0.05
@@ -33,6 +50,8 @@ EFFICIENCY_TABLE = [
 ]
 
 OVERHEAD_FACTOR = 1.0
+BLOCKS_PER_DAY = 144
+KWH_PER_WATT_DAY = 86400 / 3_600_000  # 1W x 24h = 0.024 kWh
 TX_FEE_RATIO_PAST = 0.05
 TX_FEE_RATIO_NOW = 0.08
 
@@ -43,85 +62,181 @@ HALVINGS = [
     datetime(2024, 4, 20),
 ]
 
+# 테이블은 import 시 한 번만 배열로 변환
+EFFICIENCY_DAYS = np.array([d for d, _ in EFFICIENCY_TABLE], dtype='datetime64[D]').astype(np.int64)
+EFFICIENCY_VALUES = np.array([v for _, v in EFFICIENCY_TABLE], dtype=np.float64)
+HALVING_DAYS = np.array(HALVINGS, dtype='datetime64[D]').astype(np.int64)
 
-def get_dynamic_efficiency(date):
-    table = [(datetime.strptime(d, '%Y-%m-%d'), v) for d, v in EFFICIENCY_TABLE]
-    if date <= table[0][0]: return table[0][1]
-    if date >= table[-1][0]: return table[-1][1]
-    for i in range(len(table) - 1):
-        if table[i][0] <= date < table[i + 1][0]:
-            days_total = (table[i + 1][0] - table[i][0]).days
-            days_elapsed = (date - table[i][0]).days
-            ratio = days_elapsed / days_total if days_total > 0 else 0
-            return table[i][1] + (table[i + 1][1] - table[i][1]) * ratio
-    return table[-1][1]
 
+def get_dynamic_efficiency(days):
+    return np.interp(days, EFFICIENCY_DAYS, EFFICIENCY_VALUES)
 
-def get_tx_fee_ratio(date):
-    latest_halving = HALVINGS[-1]
-    if date < latest_halving: return TX_FEE_RATIO_PAST
-    d = (date - latest_halving).days
-    return TX_FEE_RATIO_PAST + (TX_FEE_RATIO_NOW - TX_FEE_RATIO_PAST) * min(d / 180, 1.0)
 
+def get_tx_fee_ratio(days):
+    d = days - HALVING_DAYS[-1]
+    return TX_FEE_RATIO_PAST + (TX_FEE_RATIO_NOW - TX_FEE_RATIO_PAST) * np.clip(d / 180, 0.0, 1.0)
 
-def get_block_reward(date):
-    reward = 50.0
-    for h in HALVINGS:
-        if date >= h:
-            reward /= 2
-        else:
-            break
-    return reward
 
+def get_block_reward(days):
+    return 50.0 / 2.0 ** np.searchsorted(HALVING_DAYS, days, side='right')
 
-def calculate_cash_cost(hashrate_th_s, block_reward, electricity_price, date):
-    efficiency = get_dynamic_efficiency(date)
-    tx_fee_ratio = get_tx_fee_ratio(date)
-    daily_btc = 144 * block_reward * (1 + tx_fee_ratio)
-    daily_energy_kwh = (hashrate_th_s * efficiency * 86400) / 3_600_000
-    daily_electricity = daily_energy_kwh * electricity_price * OVERHEAD_FACTOR
-    return daily_electricity / daily_btc
+
+def calculate_cash_cost(hashrate_th_s, block_reward, electricity_prices, days):
+    # 전기료와 무관한 BTC 1개당 전력량(kWh)을 먼저 구한 뒤 전기료별로 곱함 -> (전기료 수, N)
+    efficiency = get_dynamic_efficiency(days)
+    tx_fee_ratio = get_tx_fee_ratio(days)
+    daily_btc = BLOCKS_PER_DAY * block_reward * (1 + tx_fee_ratio)
+    daily_energy_kwh = hashrate_th_s * efficiency * KWH_PER_WATT_DAY
+    kwh_per_btc = daily_energy_kwh * OVERHEAD_FACTOR / daily_btc
+    return np.multiply.outer(electricity_prices, kwh_per_btc)
+
+
+# 14일 이동평균 스무딩 (마지막 축 기준, 앞부분은 가능한 구간만 평균)
+# 센트 단위 정수로 누적합/반올림(0.5센트는 올림)하므로 부동소수점 오차에 따라 결과가 바뀌지 않음
+def smooth(arr, window=14):
+    cents = np.rint(np.asarray(arr) * 100).astype(np.int64)
+    cs = np.cumsum(cents, axis=-1)
+    cs = np.concatenate((np.zeros(cs.shape[:-1] + (1,), dtype=np.int64), cs), axis=-1)
+    idx = np.arange(cents.shape[-1])
+    start = np.maximum(0, idx - window + 1)
+    count = idx - start + 1
+    total = cs[..., idx + 1] - cs[..., start]
+    return ((2 * total + count) // (2 * count)) / 100
+
+
+def history_stamp():
+    """(mtime, size) of the CSV and history files, None if either is missing"""
+    try:
+        return ';'.join(f"{st.st_mtime_ns}:{st.st_size}"
+                        for st in (os.stat(BTC_CSV_FILE), os.stat(BTC_HISTORY_FILE)))
+    except OSError:
+        return None
 
 
 def generate_btc_history_json():
     if not os.path.exists(BTC_CSV_FILE):
         print(f"[INFO] {BTC_CSV_FILE} not found, skipping")
         return False
+
+    # 마지막 변환 이후 두 파일 모두 그대로면 건너뜀
+    # (stamp에 두 파일의 mtime이 들어가므로, checkout으로 mtime이 바뀌는 CI에서는 항상 다시 생성)
+    stamp_path = os.path.join(CACHE_DIR, 'btc_history.stamp')
+    stamp = history_stamp()
+    try:
+        with open(stamp_path, 'r') as f:
+            if stamp is not None and f.read() == stamp:
+                print(f"[SKIP] {BTC_HISTORY_FILE} up to date")
+                return True
+    except OSError:
+        pass
+
     print(f"[CSV] Reading {BTC_CSV_FILE}...")
     prices = {}
-    with open(BTC_CSV_FILE, 'r') as f:
-        reader = csv.DictReader(f)
+    with open(BTC_CSV_FILE, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if 'Date' not in header or 'Close' not in header:
+            print(f"[ERR] {BTC_CSV_FILE}: Date/Close columns missing")
+            return False
+        date_col, close_col = header.index('Date'), header.index('Close')
         for row in reader:
-            date = row['Date'].strip()
             try:
-                prices[date] = round(float(row['Close']), 2)
-            except (ValueError, KeyError):
+                prices[row[date_col].strip()] = round(float(row[close_col]), 2)
+            except (ValueError, IndexError):
                 continue
     with open(BTC_HISTORY_FILE, 'w') as f:
         json.dump(prices, f)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(stamp_path, 'w') as f:
+            f.write(history_stamp())
+    except OSError as e:
+        print(f"   [WARN] stamp write failed ({stamp_path}): {e}")
     dates = sorted(prices.keys())
     print(f"   [OK] {BTC_HISTORY_FILE}: {len(prices)} days ({dates[0]} ~ {dates[-1]})")
     return True
 
 
+def values_to_dict(values):
+    """blockchain.info values -> {days since 1970-01-01: y}"""
+    xs = np.fromiter((item['x'] for item in values), dtype=np.int64, count=len(values))
+    ys = np.fromiter((item['y'] for item in values), dtype=np.float64, count=len(values))
+    return dict(zip((xs // 86400).tolist(), ys.tolist()))
+
+
+def day_str(day):
+    return str(np.datetime64(day, 'D'))
+
+
+def cache_path(url_path, timespan, sampled):
+    suffix = '_sampled' if sampled else ''
+    return os.path.join(CACHE_DIR, f"{url_path}_{timespan}{suffix}.json")
+
+
+def read_cache(path, max_age_days=0):
+    """저장 후 max_age_days(UTC 날짜 기준) 이내인 캐시만 사용 (빈 목록은 miss)"""
+    try:
+        mtime = datetime.utcfromtimestamp(os.path.getmtime(path))
+        age = (datetime.utcnow().date() - mtime.date()).days
+        if not 0 <= age <= max_age_days:
+            return None
+    except OSError:
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f) or None
+    except (OSError, ValueError) as e:
+        print(f"   [WARN] cache unreadable ({path}): {e}")
+        drop_cache(path)
+        return None
+
+
+def drop_cache(path):
+    # 잘못된 캐시 파일은 지워서 CI의 actions/cache로 다음 실행에 넘어가지 않게 함
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def write_cache(path, values):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(values, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"   [WARN] cache write failed ({path}): {e}")
+
+
 def fetch_api(url_path, timespan, sampled=False):
-    """blockchain.info API fetch"""
+    """blockchain.info API fetch (디스크 캐시 우선)"""
+    path = cache_path(url_path, timespan, sampled)
+    values = read_cache(path, CACHE_MAX_AGE_DAYS.get(timespan, 0))
+    if values is not None:
+        try:
+            return values_to_dict(values)
+        except Exception as e:
+            print(f"   [WARN] cache invalid ({path}): {e}")
+            drop_cache(path)
+
     url = f"https://api.blockchain.info/charts/{url_path}"
     params = {'timespan': timespan, 'format': 'json'}
     if sampled:
         params['sampled'] = 'true'
     try:
-        r = requests.get(url, params=params, timeout=60)
+        r = SESSION.get(url, params=params, timeout=60)
         r.raise_for_status()
         values = r.json()['values']
-        result = {}
-        for item in values:
-            d = datetime.utcfromtimestamp(item['x']).strftime('%Y-%m-%d')
-            result[d] = item['y']
-        return result
+        result = values_to_dict(values)
     except Exception as e:
         print(f"   [ERR] {url_path} ({timespan}): {e}")
         return {}
+    # 변환에 성공한 응답만 저장, 일시적인 빈 응답도 캐시 기간 동안 재사용되지 않도록 제외
+    if result:
+        write_cache(path, values)
+    return result
 
 
 def main():
@@ -134,21 +249,19 @@ def main():
     # blockchain.info timespan=all returns 4-day sampled data, often weeks behind
     # So we fetch recent 1 year separately for daily, up-to-date data
 
-    print("[API] Fetching hash-rate (recent 1y, daily)...")
-    hash_recent = fetch_api('hash-rate', '1year', sampled=False)
-    print(f"   [OK] {len(hash_recent)} daily points")
-
-    print("[API] Fetching hash-rate (all, sampled)...")
-    hash_hist = fetch_api('hash-rate', 'all', sampled=True)
-    print(f"   [OK] {len(hash_hist)} sampled points")
-
-    print("[API] Fetching market-price (recent 1y, daily)...")
-    price_recent = fetch_api('market-price', '1year', sampled=False)
-    print(f"   [OK] {len(price_recent)} daily points")
-
-    print("[API] Fetching market-price (all, sampled)...")
-    price_hist = fetch_api('market-price', 'all', sampled=True)
-    print(f"   [OK] {len(price_hist)} sampled points")
+    # 4개 요청은 서로 독립적이므로 동시에 보냄
+    print("[API] Fetching hash-rate & market-price (recent 1y daily + all sampled)...")
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        f_hash_recent = ex.submit(fetch_api, 'hash-rate', '1year', sampled=False)
+        f_hash_hist = ex.submit(fetch_api, 'hash-rate', 'all', sampled=True)
+        f_price_recent = ex.submit(fetch_api, 'market-price', '1year', sampled=False)
+        f_price_hist = ex.submit(fetch_api, 'market-price', 'all', sampled=True)
+    hash_recent = f_hash_recent.result()
+    hash_hist = f_hash_hist.result()
+    price_recent = f_price_recent.result()
+    price_hist = f_price_hist.result()
+    print(f"   [OK] hash-rate: {len(hash_recent)} daily + {len(hash_hist)} sampled points")
+    print(f"   [OK] market-price: {len(price_recent)} daily + {len(price_hist)} sampled points")
 
     # Merge: historical base, recent overrides
     hash_dict = {**hash_hist, **hash_recent}
@@ -158,46 +271,32 @@ def main():
         print("[ERR] API data unavailable")
         return
 
-    hash_dates = sorted(hash_dict.keys())
-    price_dates = sorted(price_dict.keys())
-    print(f"\n[MERGE] Hash-rate: {len(hash_dict)} ({hash_dates[0]} ~ {hash_dates[-1]})")
-    print(f"[MERGE] Price: {len(price_dict)} ({price_dates[0]} ~ {price_dates[-1]})")
+    print(f"\n[MERGE] Hash-rate: {len(hash_dict)} ({day_str(min(hash_dict))} ~ {day_str(max(hash_dict))})")
+    print(f"[MERGE] Price: {len(price_dict)} ({day_str(min(price_dict))} ~ {day_str(max(price_dict))})")
 
-    common_dates = sorted(set(hash_dict.keys()) & set(price_dict.keys()))
-    print(f"[MERGE] Common: {len(common_dates)} ({common_dates[0]} ~ {common_dates[-1]})")
+    # keys view 교집합은 작은 쪽을 순회하며 큰 쪽 dict에 멤버십 검사
+    common_days = sorted(hash_dict.keys() & price_dict.keys())
+    print(f"[MERGE] Common: {len(common_days)} ({day_str(common_days[0])} ~ {day_str(common_days[-1])})")
+
+    # 날짜별 계산을 배열 연산으로 한 번에 처리 (행: 전기료 low/mid/high)
+    # 날짜는 1970-01-01 기준 일수(int64), 문자열은 출력할 때 한 번만 변환
+    days = np.array(common_days, dtype=np.int64)
+    hashrates = np.fromiter((hash_dict[d] for d in common_days), dtype=np.float64, count=len(common_days))
+    rewards = get_block_reward(days)
+    electricity = np.array([ELECTRICITY_LOW, (ELECTRICITY_LOW + ELECTRICITY_HIGH) / 2, ELECTRICITY_HIGH])
+    costs = calculate_cash_cost(hashrates, rewards, electricity, days).round(2)
+    costs = smooth(costs).round(2)
+    prices = np.fromiter((price_dict[d] for d in common_days), dtype=np.float64, count=len(common_days))
 
     results = {
-        'dates': [], 'btc_prices': [], 'mining_cost_low': [],
-        'mining_cost_mid': [], 'mining_cost_high': [], 'last_updated': ''
+        'dates': np.datetime_as_string(days.astype('datetime64[D]')).tolist(),
+        'btc_prices': prices.round(2).tolist(),
+        'mining_cost_low': costs[0].tolist(),
+        'mining_cost_mid': costs[1].tolist(),
+        'mining_cost_high': costs[2].tolist(),
+        'last_updated': ''
     }
 
-    for d_str in common_dates:
-        date_obj = datetime.strptime(d_str, '%Y-%m-%d')
-        h_raw = hash_dict[d_str]
-        reward = get_block_reward(date_obj)
-
-        cost_low = calculate_cash_cost(h_raw, reward, ELECTRICITY_LOW, date_obj)
-        cost_high = calculate_cash_cost(h_raw, reward, ELECTRICITY_HIGH, date_obj)
-        cost_mid = (cost_low + cost_high) / 2
-
-        results['dates'].append(d_str)
-        results['btc_prices'].append(round(price_dict[d_str], 2))
-        results['mining_cost_low'].append(round(cost_low, 2))
-        results['mining_cost_mid'].append(round(cost_mid, 2))
-        results['mining_cost_high'].append(round(cost_high, 2))
-
-    # 14일 이동평균 스무딩
-    def smooth(arr, window=14):
-        result = []
-        for i in range(len(arr)):
-            start = max(0, i - window + 1)
-            result.append(round(sum(arr[start:i + 1]) / (i - start + 1), 2))
-        return result
-
-    results['mining_cost_low'] = smooth(results['mining_cost_low'])
-    results['mining_cost_mid'] = smooth(results['mining_cost_mid'])
-    results['mining_cost_high'] = smooth(results['mining_cost_high'])
-
     results['current_price'] = results['btc_prices'][-1]
     results['current_cost_mid'] = results['mining_cost_mid'][-1]
     results['current_cost_low'] = results['mining_cost_low'][-1]
@@ -205,7 +304,7 @@ def main():
     results['last_updated'] = datetime.utcnow().isoformat() + 'Z'
 
     with open(DATA_FILE, 'w') as f:
-        json.dump(results, f, indent=2)
+        json.dump(results, f, separators=(',', ':'))
 
     print(f"\n[SAVE] {DATA_FILE}")
     print(f"   Range: {results['dates'][0]} ~ {results['dates'][-1]}")